@@ -1,11 +1,13 @@
 import argparse
 import grp
+import hashlib
 import json
 import os
 import subprocess
 import pwd
 import stat
 import sys
+import tempfile
 import uuid
 
 from filelock import FileLock
@@ -44,6 +46,14 @@ def service_path(project_id):
     return f"{project_path(project_id)}/pv-{project_id}-launcher.service"
 
 
+def hashes_path(project_id):
+    return f"{project_path(project_id)}/hashes.json"
+
+
+def reload_capable_path(project_id):
+    return f"{project_path(project_id)}/reload_capable"
+
+
 def settings_file():
     return f"/srv/pv-configurator/configurator_settings.json"
 
@@ -61,6 +71,7 @@ def systemd_unit(username, settings, project_id):
     Type=simple
     Restart=no
     ExecStart={settings.launcher_exec} {launcher_config_path(project_id)}
+    ExecReload=/bin/kill -HUP $MAINPID
     RestartSec=5
     
     [Service]
@@ -125,6 +136,100 @@ def project_values(port, port_ranges, dataDir, loadFile):
     return config
 
 
+def render_json(obj):
+    """Canonical serialization, equal configs always produce equal bytes (and hashes)"""
+    return json.dumps(obj, sort_keys=True).encode("utf-8")
+
+
+def render_unit(username, settings, project_id):
+    return systemd_unit(username, settings, project_id).encode("utf-8")
+
+
+# endregion
+
+# region content hashes
+
+def content_hash(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def load_hashes(project_id):
+    """Returns the hashes of the config files as they were last applied, keyed by file name
+
+    A missing or unreadable file counts as empty, so every file is rewritten and the launcher restarted.
+    """
+    try:
+        with open(hashes_path(project_id), "r") as fd:
+            hashes = json.load(fd)
+    except (FileNotFoundError, ValueError):
+        # ValueError includes JSONDecodeError and UnicodeDecodeError
+        return {}
+    if not isinstance(hashes, dict):
+        return {}
+    return hashes
+
+
+def store_hashes(project_id, hashes):
+    # <id>/hashes.json
+    # root:root rw- --- ---
+    atomic_write(hashes_path(project_id), render_json(hashes), chmod_rw_only)
+
+
+def atomic_write(path, content, chmod, gid=-1):
+    """Write content to a temp file next to path and rename it over path
+
+    Owner group and permissions are set on the temp file before the rename, so readers
+    (e.g. the launcher) only ever see the complete old or the complete new file.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        os.chown(tmp_path, -1, gid, follow_symlinks=False)
+        chmod(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def is_reload_capable(project_id):
+    return os.path.exists(reload_capable_path(project_id))
+
+
+def mark_reload_capable(project_id):
+    """Record that the running launcher was started from a unit with ExecReload
+
+    Only call this after the service has been (re)started from the current unit file. Sending SIGHUP to
+    a launcher started from an older unit would kill it, as would a launcher.py without a SIGHUP handler,
+    so /opt/pv-launcher has to be updated before the configurator.
+    """
+    # <id>/reload_capable
+    # root:root rw- --- ---
+    with open(reload_capable_path(project_id), "w"):
+        pass
+    chmod_rw_only(reload_capable_path(project_id))
+
+
+def write_if_changed(path, content, hashes, chmod, gid=-1):
+    """Write content to path unless its hash matches the stored one
+
+    Updates hashes (see load_hashes) and returns True if the file was written.
+    """
+    name = os.path.basename(path)
+    digest = content_hash(content)
+    if hashes.get(name) == digest and os.path.exists(path):
+        return False
+    atomic_write(path, content, chmod, gid)
+    hashes[name] = digest
+    return True
+
+
 # endregion
 
 # region ports
@@ -313,15 +418,27 @@ def register_systemd_service(project_id):
 
 
 def start_systemd_service(project_id):
-    subprocess.Popen(
+    """Returns the exit code of systemctl, as do the other functions in this region"""
+    return subprocess.Popen(
         ["/usr/bin/systemctl", "start", f"pv-{project_id}-launcher.service"]).wait()
 
 
 def restart_systemd_service(project_id):
-    subprocess.Popen(
+    return subprocess.Popen(
         ["/usr/bin/systemctl", "restart", f"pv-{project_id}-launcher.service"]).wait()
 
 
+def reload_systemd_service(project_id):
+    """Make the launcher re-read its config, running sessions are kept alive"""
+    return subprocess.Popen(
+        ["/usr/bin/systemctl", "reload", f"pv-{project_id}-launcher.service"]).wait()
+
+
+def reload_systemd_units():
+    return subprocess.Popen(
+        ["/usr/bin/systemctl", "daemon-reload"]).wait()
+
+
 def remove_systemd_service(project_id):
     subprocess.Popen(
         ["/usr/bin/systemctl", "stop", f"pv-{project_id}-launcher.service"]).wait()
@@ -396,6 +513,48 @@ def project_url(project_id, servername):
     return f"http://{servername}/?sessionManagerURL=http://{servername}/project/{project_id}"
 
 
+def write_config_files(username, settings, project_id, launcher_conf, project_vals):
+    """Write the config files of a project, skipping those whose content did not change
+
+    Returns a tuple (new hashes, launcher config changed, systemd unit changed).
+    The hashes are not stored, call store_hashes once the new config has been applied. Until then
+    the next run still sees the files as changed.
+    """
+    hashes = load_hashes(project_id)
+
+    # <id>/launcher_config.json
+    # root:pv-launcher rw- r-- ---
+    launcher_changed = write_if_changed(launcher_config_path(project_id), render_json(launcher_conf), hashes,
+                                        chmod_rw_r, grp.getgrnam("pv-launcher").gr_gid)
+
+    # <id>/config.json
+    # root:root rw- --- ---
+    write_if_changed(project_config_path(project_id), render_json(project_vals), hashes, chmod_rw_only)
+
+    # <id>/*.service
+    # root:root rw- --- ---
+    unit_changed = write_if_changed(service_path(project_id), render_unit(username, settings, project_id), hashes,
+                                    chmod_rw_only)
+
+    return hashes, launcher_changed, unit_changed
+
+
+def apply_config(project_id, unit_changed):
+    """Make the running launcher use the config files, returns True on success"""
+    if unit_changed:
+        # changes to the unit itself (e.g. ExecStart) only take effect on a restart
+        if reload_systemd_units() != 0:
+            return False
+    elif is_reload_capable(project_id) and reload_systemd_service(project_id) == 0:
+        return True
+
+    # no reload possible, or it failed (e.g. the service is not running)
+    if restart_systemd_service(project_id) != 0:
+        return False
+    mark_reload_capable(project_id)
+    return True
+
+
 def create(username, settings, args):
     project_id = generate_project_id()
 
@@ -431,31 +590,17 @@ def create(username, settings, args):
              follow_symlinks=False)
     chmod_rw_r(sessions_path(project_id))
 
-    # <id>/launcher_config.json
-    # root:pv-launcher rw- r-- ---
-    with open(launcher_config_path(project_id), "w") as fd:
-        json.dump(launcher_conf, fd)
-    os.chown(launcher_config_path(project_id), -1, grp.getgrnam("pv-launcher").gr_gid,
-             follow_symlinks=False)
-    chmod_rw_r(launcher_config_path(project_id))
-
-    # <id>/config.json
-    # root:root rw- --- ---
-    with open(project_config_path(project_id), "w") as fd:
-        json.dump(project_vals, fd)
-    chmod_rw_only(project_config_path(project_id))
-
-    # <id>/*.service
-    # root:root rw- --- ---
-    with open(service_path(project_id), "w") as fd:
-        fd.write(systemd_unit(username, settings, project_id))
-    chmod_rw_only(service_path(project_id))
+    hashes, _, _ = write_config_files(username, settings, project_id, launcher_conf, project_vals)
 
     add_launcher(project_id, launcher_port)
     add_project_to_user(username, project_id)
 
     register_systemd_service(project_id)
-    start_systemd_service(project_id)
+    if start_systemd_service(project_id) == 0:
+        mark_reload_capable(project_id)
+        store_hashes(project_id, hashes)
+    else:
+        print("Could not start the launcher, run modify to retry")
     print(f"New project: {project_id}, Open browser at")
     print(project_url(project_id, settings.servername))
 
@@ -483,12 +628,19 @@ def edit(username, settings, args):
 
     launcher_conf = launcher_config(username, settings, project_id, launcher_port, port_ranges, dataDir, loadFile)
     config_conf = project_values(launcher_port, port_ranges, dataDir, loadFile)
-    with open(launcher_config_path(project_id), "w") as fd:
-        json.dump(launcher_conf, fd)
-    with open(project_config_path(project_id), "w") as fd:
-        json.dump(config_conf, fd)
+    hashes, launcher_changed, unit_changed = write_config_files(username, settings, project_id, launcher_conf,
+                                                                config_conf)
+
+    if not launcher_changed and not unit_changed:
+        # config.json is not read by the launcher, nothing to apply
+        store_hashes(project_id, hashes)
+        print("Nothing changed")
+        return
 
-    restart_systemd_service(project_id)
+    if not apply_config(project_id, unit_changed):
+        print("Could not apply the new configuration, run modify again to retry")
+        sys.exit(1)
+    store_hashes(project_id, hashes)
 
 
 def remove(username, args):
@@ -506,6 +658,12 @@ def remove(username, args):
     os.remove(project_config_path(project_id))
     os.remove(launcher_config_path(project_id))
     os.remove(sessions_path(project_id))
+    for path in [hashes_path(project_id), reload_capable_path(project_id)]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # projects published before these files were written
+            pass
     release_ports([launcher_port] + port_ranges)
     os.rmdir(project_path(project_id))
 
@@ -1,7 +1,63 @@
 #!/opt/pv-launcher/venv/bin/python
+import argparse
+import asyncio
 import os
+import signal
 
+from wslink import backends
 from wslink import launcher
 
 os.environ["PYTHONUNBUFFERED"] = "1"
-launcher.start()
\ No newline at end of file
+
+
+def reload_config(config, args):
+    """Re-read the config file (systemctl reload)
+
+    Only the templates used when a new session is created are replaced, so running
+    visualizer sessions are left alone and keep their ports, while new sessions use the new config.
+    """
+    try:
+        new_config = launcher.parseConfig(args)
+        # build everything first, then swap it in with a single update
+        configuration = dict(config["configuration"], sessionURL=new_config["configuration"]["sessionURL"])
+        new_values = {
+            "apps": new_config["apps"],
+            "properties": new_config["properties"],
+            "configuration": configuration,
+            "sessionData": new_config.get("sessionData", {}),
+        }
+    except (Exception, SystemExit):
+        # parseConfig exits on invalid files, keep serving with the old config instead
+        launcher.logger.exception("Reload failed, keeping previous configuration")
+        return
+
+    config.update(new_values)
+    print("Configuration reloaded")
+
+
+def on_sighup(config, args):
+    """Signal handler, defers the actual reload to the event loop
+
+    Running it directly could interrupt wslink in the middle of creating a session.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # web server not started yet, so there are no sessions to interfere with
+        reload_config(config, args)
+        return
+    loop.call_soon_threadsafe(reload_config, config, args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="wslink Web Launcher")
+    launcher.add_arguments(parser)
+    args = parser.parse_args()
+    config = launcher.parseConfig(args)
+
+    # the event loop is created inside wslink, so loop.add_signal_handler can't be used here
+    signal.signal(signal.SIGHUP, lambda signum, frame: on_sighup(config, args))
+    backends.launcher_start(args, config, backend=args.backend)
+
+
+main()